@@ -2,6 +2,13 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import configparser
+import argparse
+import json
+import os
+import re
+import time
+
+from run_simulation import process_alive
 
 config = configparser.ConfigParser()
 config.read('simulation.config')
@@ -20,25 +27,11 @@ def apply_dark_blue_theme():
         'grid.color': 'gray', 'grid.alpha': 0.3,
     })
 
-#File Loading
-df = pd.read_csv(
-    'out_omni.dat',
-    sep='\t',
-    names=[
-        'E_beam', 'E_incident', 'E_deposited', 'x_incident', 'y_incident',
-        'z_incident', 'theta', 'Time', 'EventID', 'TrackID', 'ParticleID',
-        'ParticleName', 'CreatorProcessName', 'IsEdepositedTotalEntry',
-        'IsSurfaceHitTrack', 'detector#'
-    ],
-    skiprows=1
-)
-
-#Data Filtering
-df_cu = df[
-    (df['detector#'] == 0) &
-    (df['E_deposited'] > 0) &
-    (df['E_incident'] > 0) &
-    (df['ParticleName'] == 'proton')
+COLUMNS = [
+    'E_beam', 'E_incident', 'E_deposited', 'x_incident', 'y_incident',
+    'z_incident', 'theta', 'Time', 'EventID', 'TrackID', 'ParticleID',
+    'ParticleName', 'CreatorProcessName', 'IsEdepositedTotalEntry',
+    'IsSurfaceHitTrack', 'detector#'
 ]
 
 #Physics Constants (NRT)
@@ -58,37 +51,253 @@ V = L * A    # Volume [m³]
 rho_Cu = 8960         # Density [kg/m³]
 M_Cu = 0.063546       # Molar mass [kg/mol]
 N_atoms = (rho_Cu * V / M_Cu) * 6.022e23  # Number of atoms in volume
-print(f"N_atoms: {N_atoms}")
-
-#NRT Damage Calculation
-E_dep_eV = df_cu['E_deposited'].sum() * 1e6  # MeV → eV
-print(f"E_dep_eV: {E_dep_eV}")
-DPA = (eta * E_dep_eV) / (2 * E_d * N_atoms)
-print(f"DPA: {DPA}")
-delta_rho = alpha * DPA
-print(f"delta_rho: {delta_rho}")
-
-#Resistance Change
-R0 = rho_0 * L / A
-R_new = (rho_0 + delta_rho) * L / A
-delta_R_pct = ((R_new - R0) / R0) * 100
-
-
-print(f"NRT Model Results ({L}×{W}×{T} m Cu)")
-print(f"DPA (NRT): {DPA:.3e}")
-print(f"Resistance change: {delta_R_pct}%")
-
-
-apply_dark_blue_theme()
-plt.hist(df_cu['E_deposited'], bins=30, color='cyan', edgecolor='white')
-plt.title('Energy Deposition Distribution')
-plt.xlabel('Energy (MeV)')
-plt.ylabel('Counts')
-plt.show()
-
-plt.scatter(df_cu['E_beam'], df_cu['E_deposited'], color='magenta', alpha=0.7, edgecolor='white')
-plt.yscale('log')
-plt.title('Incident vs Deposited Energy')
-plt.xlabel('Incident Energy (MeV)')
-plt.ylabel('Deposited Energy (MeV)')
-plt.show()
+
+#Fixed histogram bins for follow mode (MeV), the full-file run uses 30 automatic bins
+E_DEP_BINS = np.logspace(-7, 3, 41)
+E_BEAM_BINS = np.logspace(0, np.log10(500), 31)
+
+def nrt_damage(E_dep_eV):
+    """NRT DPA, resistivity change and resistance change [%] for deposited energy in eV"""
+    DPA = (eta * E_dep_eV) / (2 * E_d * N_atoms)
+    delta_rho = alpha * DPA
+    R0 = rho_0 * L / A
+    R_new = (rho_0 + delta_rho) * L / A
+    delta_R_pct = ((R_new - R0) / R0) * 100
+    return DPA, delta_rho, delta_R_pct
+
+def analyze_file(path):
+    #File Loading
+    df = pd.read_csv(
+        path,
+        sep='\t',
+        names=COLUMNS,
+        skiprows=1
+    )
+
+    #Data Filtering
+    df_cu = df[
+        (df['detector#'] == 0) &
+        (df['E_deposited'] > 0) &
+        (df['E_incident'] > 0) &
+        (df['ParticleName'] == 'proton')
+    ]
+
+    print(f"N_atoms: {N_atoms}")
+
+    #NRT Damage Calculation
+    E_dep_eV = df_cu['E_deposited'].sum() * 1e6  # MeV → eV
+    print(f"E_dep_eV: {E_dep_eV}")
+    DPA, delta_rho, delta_R_pct = nrt_damage(E_dep_eV)
+    print(f"DPA: {DPA}")
+    print(f"delta_rho: {delta_rho}")
+
+
+    print(f"NRT Model Results ({L}×{W}×{T} m Cu)")
+    print(f"DPA (NRT): {DPA:.3e}")
+    print(f"Resistance change: {delta_R_pct}%")
+
+
+    apply_dark_blue_theme()
+    plt.hist(df_cu['E_deposited'], bins=30, color='cyan', edgecolor='white')
+    plt.title('Energy Deposition Distribution')
+    plt.xlabel('Energy (MeV)')
+    plt.ylabel('Counts')
+    plt.show()
+
+    plt.scatter(df_cu['E_beam'], df_cu['E_deposited'], color='magenta', alpha=0.7, edgecolor='white')
+    plt.yscale('log')
+    plt.title('Incident vs Deposited Energy')
+    plt.xlabel('Incident Energy (MeV)')
+    plt.ylabel('Deposited Energy (MeV)')
+    plt.show()
+
+def read_events_to_run(gdml_path='copper_omni.gdml'):
+    """EventsToRun from the gdml file, None if it is not available"""
+    try:
+        with open(gdml_path) as f:
+            match = re.search(r'name="EventsToRun" value="(\d+)"', f.read())
+    except OSError:
+        return None
+    return int(match.group(1)) if match else None
+
+class OutputFollower:
+    """Running totals over the grasshopper output, updated one complete line at a time"""
+
+    def __init__(self, events_to_run=None):
+        self.events_to_run = events_to_run
+        self.rows = 0
+        self.proton_rows = 0
+        self.last_event_id = 0
+        self.E_dep_MeV = 0.0
+        self.e_dep_hist = np.zeros(len(E_DEP_BINS) - 1, dtype=np.int64)
+        self.e_beam_hist = np.zeros(len(E_BEAM_BINS) - 1, dtype=np.int64)
+        self.start_time = time.time()
+        self.last_snapshot_time = self.start_time
+        self.last_snapshot_event = 0
+
+    def add_line(self, line):
+        fields = line.rstrip('\r').split('\t')
+        if fields[0].startswith('E_beam'):  # header
+            return
+        self.rows += 1
+        #Same filter as the full-file analysis; short rows have no detector# column
+        if len(fields) != len(COLUMNS):
+            return
+        try:
+            E_beam = float(fields[0])
+            E_incident = float(fields[1])
+            E_deposited = float(fields[2])
+            event_id = int(fields[8])
+            detector = int(fields[15])
+        except ValueError:
+            return
+        self.last_event_id = max(self.last_event_id, event_id)
+        if detector != 0 or E_deposited <= 0 or E_incident <= 0 or fields[11] != 'proton':
+            return
+        self.proton_rows += 1
+        self.E_dep_MeV += E_deposited
+        #Values outside the bin range go into the first/last bin
+        i = np.searchsorted(E_DEP_BINS, E_deposited, side='right') - 1
+        self.e_dep_hist[min(max(i, 0), len(self.e_dep_hist) - 1)] += 1
+        i = np.searchsorted(E_BEAM_BINS, E_beam, side='right') - 1
+        self.e_beam_hist[min(max(i, 0), len(self.e_beam_hist) - 1)] += 1
+
+    def snapshot(self, finished=False):
+        now = time.time()
+        elapsed = now - self.start_time
+        interval = now - self.last_snapshot_time
+        #EventIDs count every simulated event, also those that never hit the copper
+        events = self.last_event_id
+        rate_avg = events / elapsed if elapsed > 0 else 0.0
+        #The final snapshot comes right after the last periodic one, so report the average there
+        rate = (events - self.last_snapshot_event) / interval if interval > 0 and not finished else rate_avg
+        DPA, delta_rho, delta_R_pct = nrt_damage(self.E_dep_MeV * 1e6)
+        snap = {
+            'time': now,
+            'elapsed_s': elapsed,
+            'finished': finished,
+            'rows': self.rows,
+            'proton_rows': self.proton_rows,
+            'events': events,
+            'events_to_run': self.events_to_run,
+            'progress': events / self.events_to_run if self.events_to_run else None,
+            'events_per_s': rate,
+            'events_per_s_avg': rate_avg,
+            'E_dep_eV': self.E_dep_MeV * 1e6,
+            'DPA': DPA,
+            'delta_rho': delta_rho,
+            'delta_R_pct': delta_R_pct,
+            'E_deposited_hist': {'bins_MeV': E_DEP_BINS.tolist(), 'counts': self.e_dep_hist.tolist()},
+            'E_beam_hist': {'bins_MeV': E_BEAM_BINS.tolist(), 'counts': self.e_beam_hist.tolist()},
+        }
+        self.last_snapshot_time = now
+        self.last_snapshot_event = events
+        return snap
+
+def write_snapshot(snap, path):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(snap, f, indent=2)
+    os.replace(tmp, path)
+
+def output_replaced(f, path):
+    """True if path was truncated below our read position or now names a different file"""
+    try:
+        current = os.stat(path)
+    except FileNotFoundError:
+        return False  # removed, keep waiting for the new file
+    st = os.fstat(f.fileno())
+    return st.st_size < f.tell() or (current.st_ino, current.st_dev) != (st.st_ino, st.st_dev)
+
+def follow(path, snapshot_path, interval, idle_timeout, pid=None, poll=0.5):
+    """Tail path while grasshopper appends to it, writing periodic JSON snapshots
+
+    With pid, stops only when that grasshopper process exits. Without it, stops
+    when the file has not been created or grown for idle_timeout seconds.
+    """
+    follower = OutputFollower(read_events_to_run())
+    print(f"Following {path}, snapshots every {interval}s to {snapshot_path}")
+
+    waiting_since = time.time()
+    while not os.path.exists(path):
+        if pid is not None and not process_alive(pid):
+            print(f"{path} was never created")
+            return
+        if pid is None and time.time() - waiting_since > idle_timeout:
+            print(f"{path} was not created within {idle_timeout}s")
+            return
+        time.sleep(poll)
+
+    buffer = b''
+    last_growth = time.time()
+    next_snapshot = time.time() + interval
+    f = open(path, 'rb')
+    try:
+        while True:
+            chunk = f.read(1 << 20)
+            if not chunk and output_replaced(f, path):
+                #A new run started writing: drop everything counted so far
+                try:
+                    new_f = open(path, 'rb')
+                except FileNotFoundError:
+                    time.sleep(poll)
+                    continue
+                print(f"{path} was truncated or replaced, starting over", flush=True)
+                f.close()
+                f = new_f
+                follower = OutputFollower(follower.events_to_run)
+                buffer = b''
+                last_growth = time.time()
+                continue
+            if chunk:
+                last_growth = time.time()
+                buffer += chunk
+                #Only complete lines, keep the partial last line for the next read
+                *lines, buffer = buffer.split(b'\n')
+                for line in lines:
+                    if line:
+                        follower.add_line(line.decode('utf-8', errors='replace'))
+            else:
+                writer_done = pid is not None and not process_alive(pid)
+                idle = pid is None and time.time() - last_growth > idle_timeout
+                if writer_done or idle:
+                    #Anything written between the last read and the exit goes through the normal read path
+                    if os.fstat(f.fileno()).st_size > f.tell():
+                        continue
+                    if buffer.strip():
+                        follower.add_line(buffer.decode('utf-8', errors='replace'))
+                    break
+                time.sleep(poll)
+
+            if time.time() >= next_snapshot:
+                snap = follower.snapshot()
+                write_snapshot(snap, snapshot_path)
+                progress = f" ({snap['progress']:.1%})" if snap['progress'] is not None else ''
+                print(f"events {snap['events']}{progress}  {snap['events_per_s']:.1f} events/s  "
+                      f"DPA {snap['DPA']:.3e}  ΔR {snap['delta_R_pct']:.3e}%", flush=True)
+                next_snapshot = time.time() + interval
+    finally:
+        f.close()
+
+    snap = follower.snapshot(finished=True)
+    write_snapshot(snap, snapshot_path)
+    print(f"Final: events {snap['events']}  DPA {snap['DPA']:.3e}  Resistance change: {snap['delta_R_pct']}%")
+
+def main():
+    parser = argparse.ArgumentParser(description='NRT damage and resistance change from grasshopper output')
+    parser.add_argument('--file', type=str, default='out_omni.dat', help='Grasshopper output file')
+    parser.add_argument('--follow', action='store_true', help='Tail the output file while grasshopper is still writing it')
+    parser.add_argument('--snapshot', type=str, default='out_omni_live.json', help='JSON snapshot file for --follow')
+    parser.add_argument('--interval', type=float, default=10.0, help='Seconds between snapshots for --follow')
+    parser.add_argument('--idle_timeout', type=float, default=600.0, help='Without --pid, stop following after this many seconds without new output')
+    parser.add_argument('--pid', type=int, default=None, help='Stop following when this process (grasshopper) exits')
+    args = parser.parse_args()
+
+    if args.follow:
+        follow(args.file, args.snapshot, args.interval, args.idle_timeout, args.pid)
+    else:
+        analyze_file(args.file)
+
+
+if __name__ == "__main__":
+    main()
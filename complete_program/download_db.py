@@ -5,6 +5,8 @@ from bs4 import BeautifulSoup
 from concurrent.futures import ThreadPoolExecutor
 import configparser
 
+from run_simulation import manifest_path, parse_range
+
 
 config = configparser.ConfigParser()
 config.read('simulation.config')
@@ -18,11 +20,20 @@ YEARS = range(YEAR_RANGE[0], YEAR_RANGE[1] + 1)
 MONTHS = range(MONTH_RANGE[0], MONTH_RANGE[1] + 1)
 SAMPLE_DAYS = DAY_RANGE[1] - DAY_RANGE[0] + 1
 
+DATA_DIR = config['SIMULATION'].get('data_dir', 'goes16_data')
+
+#Files selected for this year/month/day range and URL, written once all of them are downloaded
+MANIFEST = manifest_path(
+    parse_range(config['SIMULATION']['years']), parse_range(config['SIMULATION']['months']),
+    parse_range(config['SIMULATION']['days']), BASE_URL, DATA_DIR
+)
+
 def create_year_folders():
     for year in YEARS:
-        os.makedirs(f"goes16_data/{year}", exist_ok=True)
+        os.makedirs(os.path.join(DATA_DIR, str(year)), exist_ok=True)
 
 def get_monthly_files(year, month):
+    """.nc files listed for the month, None if the listing could not be fetched"""
     url = f"{BASE_URL}/{year}/{month:02d}/"
     try:
         response = requests.get(url, timeout=10)
@@ -32,19 +43,22 @@ def get_monthly_files(year, month):
                if link['href'].endswith('.nc') and 'ops_seis-l1b-sgps' in link['href']]
     except Exception as e:
         print(f"Error fetching {year}-{month:02d}: {str(e)}")
-        return []
+        return None
 
 def download_file(year, month, day_file):
     url = f"{BASE_URL}/{year}/{month:02d}/{day_file}"
-    local_path = f"goes16_data/{year}/{day_file}"
+    local_path = os.path.join(DATA_DIR, str(year), day_file)
 
     if not os.path.exists(local_path):
         try:
             with requests.get(url, stream=True, timeout=15) as response:
                 response.raise_for_status()
-                with open(local_path, 'wb') as f:
+                #Write to a temp name first so readers never see a partial .nc file
+                with open(local_path + '.part', 'wb') as f:
                     for chunk in response.iter_content(chunk_size=8192):
                         f.write(chunk)
+                os.replace(local_path + '.part', local_path)
+                os.chmod(local_path, 0o444)  # shared between runs, never modified again
             print(f"Downloaded {year}/{month:02d}/{day_file}")
             return True
         except Exception as e:
@@ -53,9 +67,12 @@ def download_file(year, month, day_file):
     return True
 
 def process_year_month(year, month):
+    """(year/file, downloaded) for the sampled files, None if the month listing failed"""
     files = get_monthly_files(year, month)
+    if files is None:
+        return None
     if not files:
-        return 0
+        return []
 
 
     sample_indices = np.linspace(0, len(files) - 1, min(SAMPLE_DAYS, len(files)), dtype=int)
@@ -64,18 +81,31 @@ def process_year_month(year, month):
     with ThreadPoolExecutor(max_workers=5) as executor:
         results = list(executor.map(lambda f: download_file(year, month, f), sampled_files))
 
-    return sum(results)
+    return [(f"{year}/{f}", ok) for f, ok in zip(sampled_files, results)]
 
 def main():
     create_year_folders()
-    total_downloaded = 0
+    selected = []
+    listing_failed = False
 
     for year in YEARS:
         for month in MONTHS:
-            downloaded = process_year_month(year, month)
-            total_downloaded += downloaded
+            month_files = process_year_month(year, month)
+            if month_files is None:
+                listing_failed = True
+            else:
+                selected.extend(month_files)
 
+    total_downloaded = sum(ok for _, ok in selected)
     print(f"\nDownload complete! {total_downloaded} files saved in year folders.")
 
+    if selected and not listing_failed and all(ok for _, ok in selected):
+        os.makedirs(os.path.dirname(MANIFEST), exist_ok=True)
+        with open(MANIFEST + '.tmp', 'w') as f:
+            f.write(''.join(f"{path}\n" for path, _ in selected))
+        os.replace(MANIFEST + '.tmp', MANIFEST)
+    else:
+        print("Some months or files could not be downloaded, no manifest written.")
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,367 @@
+import os
+import sys
+import json
+import time
+import fcntl
+import signal
+import shutil
+import hashlib
+import argparse
+import threading
+import contextlib
+from datetime import datetime
+
+from run_simulation import build_config, build_steps, run_steps, read_manifest, parse_range, process_alive
+
+#All job state lives under JOBS_DIR, one workspace per job
+JOBS_DIR = 'jobs'
+#GOES data downloaded once and shared (read-only) by all jobs
+SHARED_DATA_DIR = 'goes16_data'
+QUEUE_LOCK = os.path.join(JOBS_DIR, 'queue.lock')
+DOWNLOAD_LOCK = os.path.join(JOBS_DIR, 'download.lock')
+#One lock file per core; a grasshopper run holds one, across all worker processes
+SIM_SLOTS_DIR = os.path.join(JOBS_DIR, 'sim_slots')
+
+ACTIVE_STATES = ('queued', 'running')
+
+#Parameters that define a job; identical parameters give the same job id
+JOB_PARAMS = ['length', 'width', 'thickness', 'years', 'months', 'days', 'scale_factor', 'url']
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """Exclusive lock shared between all submit/worker processes"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+@contextlib.contextmanager
+def sim_slot(slots, poll=1.0):
+    """Hold one of the slot lock files in SIM_SLOTS_DIR, waiting until one is free"""
+    os.makedirs(SIM_SLOTS_DIR, exist_ok=True)
+    while True:
+        for i in range(slots):
+            f = open(os.path.join(SIM_SLOTS_DIR, f'slot{i}.lock'), 'w')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                continue
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+                f.close()
+            return
+        time.sleep(poll)
+
+
+def job_id_for(params):
+    """Stable id from the normalized job parameters"""
+    key = json.dumps({k: params[k] for k in JOB_PARAMS}, sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()[:12]
+
+
+def job_dir(job_id):
+    return os.path.join(JOBS_DIR, job_id)
+
+
+def read_job(job_id):
+    with open(os.path.join(job_dir(job_id), 'job.json')) as f:
+        return json.load(f)
+
+
+def write_job(job):
+    path = os.path.join(job_dir(job['id']), 'job.json')
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(job, f, indent=2)
+    os.replace(tmp, path)
+
+
+def list_jobs():
+    if not os.path.isdir(JOBS_DIR):
+        return []
+    jobs = []
+    for name in os.listdir(JOBS_DIR):
+        if os.path.isfile(os.path.join(JOBS_DIR, name, 'job.json')):
+            jobs.append(read_job(name))
+    return sorted(jobs, key=lambda j: j['submitted'])
+
+
+def now():
+    return datetime.now().isoformat(timespec='seconds')
+
+
+def mark_failed(job, error):
+    job['status'] = 'failed'
+    job['finished'] = now()
+    job['error'] = error
+    write_job(job)
+
+
+def reap_stale_jobs():
+    """Mark running jobs whose worker process has exited as failed (call with QUEUE_LOCK held)"""
+    for job in list_jobs():
+        if job['status'] == 'running' and not process_alive(job.get('worker_pid', 0)):
+            mark_failed(job, 'worker exited while the job was running')
+
+
+def normalize_params(args):
+    """Normalize ranges and numbers so equivalent submissions deduplicate"""
+    years = parse_range(args.years)
+    months = parse_range(args.months)
+    days = parse_range(args.days)
+    return {
+        'length': float(args.length),
+        'width': float(args.width),
+        'thickness': float(args.thickness),
+        'years': f"{years.start},{years.stop - 1}",
+        'months': f"{months.start},{months.stop - 1}",
+        'days': f"{days.start},{days.stop - 1}",
+        'scale_factor': float(args.scale_factor),
+        'url': args.url.rstrip('/'),
+    }
+
+
+def prepare_workspace(job):
+    """Create the isolated job directory with its own simulation.config"""
+    workdir = job_dir(job['id'])
+    for name in ('simulation.config', 'copper_omni.gdml', 'input_spectrum.txt', 'out_omni.dat',
+                 'out_omni_live.json', 'job.log'):
+        path = os.path.join(workdir, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+    data_dir = os.path.join(workdir, 'goes16_data')
+    if os.path.islink(data_dir):
+        os.remove(data_dir)
+    elif os.path.isdir(data_dir):
+        shutil.rmtree(data_dir)
+
+    os.makedirs(SHARED_DATA_DIR, exist_ok=True)
+    config = build_config(argparse.Namespace(**job['params']))
+    #download_db.py saves into the shared directory, the job only sees its own files
+    config['SIMULATION']['data_dir'] = os.path.abspath(SHARED_DATA_DIR)
+    with open(os.path.join(workdir, 'simulation.config'), 'w') as configfile:
+        config.write(configfile)
+
+
+def submit(args):
+    params = normalize_params(args)
+    job_id = job_id_for(params)
+
+    with file_lock(QUEUE_LOCK):
+        reap_stale_jobs()
+        if os.path.isfile(os.path.join(job_dir(job_id), 'job.json')):
+            job = read_job(job_id)
+            if job['status'] in ACTIVE_STATES:
+                print(f"Identical job {job_id} already {job['status']}")
+                return
+            #Re-queuing would clear the finished workspace
+            if job['status'] == 'done':
+                print(f"Identical job {job_id} already done, results in {job_dir(job_id)}")
+                return
+        os.makedirs(job_dir(job_id), exist_ok=True)
+        job = {
+            'id': job_id,
+            'params': params,
+            'status': 'queued',
+            'submitted': now(),
+            'started': None,
+            'finished': None,
+        }
+        write_job(job)
+    print(f"Submitted job {job_id}")
+
+
+def status(args):
+    jobs = list_jobs()
+    if args.job_id:
+        jobs = [j for j in jobs if j['id'] == args.job_id]
+        if not jobs:
+            print(f"No job {args.job_id}")
+            sys.exit(1)
+    if not jobs:
+        print("No jobs submitted.")
+        return
+    print(f"{'JOB':<14}{'STATUS':<10}{'SUBMITTED':<21}{'FINISHED':<21}PARAMS")
+    for job in jobs:
+        p = job['params']
+        desc = f"{p['length']}x{p['width']}x{p['thickness']}nm years={p['years']} scale={p['scale_factor']}"
+        print(f"{job['id']:<14}{job['status']:<10}{job['submitted']:<21}{job['finished'] or '-':<21}{desc}")
+
+    if args.job_id:
+        live_path = os.path.join(job_dir(args.job_id), 'out_omni_live.json')
+        if os.path.isfile(live_path):
+            with open(live_path) as f:
+                snap = json.load(f)
+            progress = f" ({snap['progress']:.1%})" if snap['progress'] is not None else ''
+            print(f"\nLive: events {snap['events']}{progress}  {snap['events_per_s']:.1f} events/s  "
+                  f"DPA {snap['DPA']:.3e}  Resistance change: {snap['delta_R_pct']:.3e}%")
+
+
+def claim_next_job():
+    """Atomically move the oldest queued job to running"""
+    with file_lock(QUEUE_LOCK):
+        reap_stale_jobs()
+        for job in list_jobs():
+            if job['status'] == 'queued':
+                job['status'] = 'running'
+                job['started'] = now()
+                job['worker_pid'] = os.getpid()
+                write_job(job)
+                return job
+    return None
+
+
+def finish_job(job, ok):
+    with file_lock(QUEUE_LOCK):
+        job['status'] = 'done' if ok else 'failed'
+        job['finished'] = now()
+        write_job(job)
+
+
+def link_job_data(workdir, files):
+    """Symlink only the job's selected .nc files into workdir/goes16_data/<year>/"""
+    for name in files:
+        link = os.path.join(workdir, 'goes16_data', name)
+        os.makedirs(os.path.dirname(link), exist_ok=True)
+        os.symlink(os.path.abspath(os.path.join(SHARED_DATA_DIR, name)), link)
+
+
+def run_job(job, children):
+    workdir = job_dir(job['id'])
+    prepare_workspace(job)
+
+    p = job['params']
+    data_range = (parse_range(p['years']), parse_range(p['months']), parse_range(p['days']), p['url'])
+    env = dict(os.environ, MPLBACKEND='Agg')  # no plot windows from worker jobs
+    step_locks = {'GRASSHOPPER_SIM': sim_slot(os.cpu_count() or 1)}
+    with open(os.path.join(workdir, 'job.log'), 'w') as log:
+        #Manifests are published with os.replace once complete, so cached data needs no lock
+        files = read_manifest(*data_range, SHARED_DATA_DIR)
+        if files is None:
+            #One download at a time; check again in case another job just fetched this range
+            with file_lock(DOWNLOAD_LOCK):
+                files = read_manifest(*data_range, SHARED_DATA_DIR)
+                if files is None:
+                    run_steps([('download_db.py', [])], workdir=workdir, env=env, stdout=log, children=children)
+                    files = read_manifest(*data_range, SHARED_DATA_DIR)
+        if files is None:
+            print("GOES data for this range could not be fully downloaded", file=log, flush=True)
+            return False
+        link_job_data(workdir, files)
+        return run_steps(build_steps(True), workdir=workdir, env=env, stdout=log,
+                         step_locks=step_locks, live=True, children=children)
+
+
+def worker_loop(poll, drain, children, stop, done):
+    try:
+        run_worker_jobs(poll, drain, children, stop)
+    finally:
+        done.set()
+
+
+def run_worker_jobs(poll, drain, children, stop):
+    while not stop.is_set():
+        job = claim_next_job()
+        if job is None:
+            if drain:
+                return
+            time.sleep(poll)
+            continue
+        print(f"Starting job {job['id']}")
+        try:
+            ok = run_job(job, children)
+        except Exception as e:
+            print(f"Job {job['id']} crashed: {str(e)}")
+            ok = False
+        finish_job(job, ok)
+        print(f"Job {job['id']} {'done' if ok else 'failed'}")
+
+
+def worker(args):
+    cores = os.cpu_count() or 1
+    workers = args.workers or cores
+
+    #Child processes (pipeline scripts, grasshopper) of all running jobs
+    children = set()
+    stop = threading.Event()
+
+    #Grasshopper is the CPU-heavy step: sim_slot() limits it to one run per core on this machine
+    print(f"Worker pool: {workers} workers, {cores} grasshopper slots shared by all workers")
+    #Thread.is_alive() is unreliable after an interrupted join(), so each thread signals when done
+    done = [threading.Event() for _ in range(workers)]
+    threads = [
+        threading.Thread(target=worker_loop, args=(args.poll, args.drain, children, stop, d), daemon=True)
+        for d in done
+    ]
+    #Stop cleanly on kill (SIGTERM) as well as on Ctrl-C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    for t in threads:
+        t.start()
+    try:
+        for t in threads:
+            t.join()
+    except KeyboardInterrupt:
+        print("\nStopping worker, terminating running jobs...")
+        stop_jobs(done, children, stop)
+
+
+def stop_jobs(done, children, stop, kill_after=10.0, give_up_after=30.0):
+    """Terminate the child processes of running jobs and mark those jobs failed"""
+    stop.set()
+    start = time.time()
+    #Keep terminating: a job thread may start its next step before it notices the failure
+    while not all(d.is_set() for d in done) and time.time() - start < give_up_after:
+        for proc in list(children):
+            if proc.poll() is None:
+                if time.time() - start < kill_after:
+                    proc.terminate()
+                else:
+                    proc.kill()
+        time.sleep(0.5)
+
+    with file_lock(QUEUE_LOCK):
+        for job in list_jobs():
+            if job['status'] == 'running' and job.get('worker_pid') == os.getpid():
+                mark_failed(job, 'worker stopped')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local job service for the radiation damage pipeline')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_submit = sub.add_parser('submit', help='Queue a simulation job')
+    p_submit.add_argument('--length', type=float, required=True, help='Copper length in nm')
+    p_submit.add_argument('--width', type=float, required=True, help='Copper width in nm')
+    p_submit.add_argument('--thickness', type=float, required=True, help='Copper thickness in nm')
+    p_submit.add_argument('--years', type=str, default='2020,2025', help='Year range (e.g. 2020 or 2020,2022)')
+    p_submit.add_argument('--months', type=str, default='1,12', help='Month range (e.g. 1 or 1,3)')
+    p_submit.add_argument('--days', type=str, default='1,31', help='Day range (e.g. 1 or 1,15)')
+    p_submit.add_argument('--scale_factor', type=float, default=1.0, help='Scaling factor for proton count')
+    p_submit.add_argument('--url', type=str, required=True, help='Base URL for downloading GOES-16 data')
+    p_submit.set_defaults(func=submit)
+
+    p_status = sub.add_parser('status', help='Show queued, running and finished jobs')
+    p_status.add_argument('job_id', nargs='?', help='Only show this job')
+    p_status.set_defaults(func=status)
+
+    p_worker = sub.add_parser('worker', help='Run the worker pool')
+    p_worker.add_argument('--workers', type=int, default=0, help='Number of concurrent jobs (default: number of cores)')
+    p_worker.add_argument('--poll', type=float, default=5.0, help='Seconds between queue checks when idle')
+    p_worker.add_argument('--drain', action='store_true', help='Exit once the queue is empty')
+    p_worker.set_defaults(func=worker)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
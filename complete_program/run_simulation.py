@@ -1,21 +1,30 @@
 import os
+import hashlib
 import subprocess
 import configparser
 import argparse
+import contextlib
 
-def check_data_exists(years):
-    """Check if data directories exist and contain .nc files"""
-    base_dir = "goes16_data"
-    if not os.path.isdir(base_dir):
-        return False
+def manifest_path(years, months, days, url, base_dir="goes16_data"):
+    """Manifest download_db.py writes for this year/month/day range and URL"""
+    url_hash = hashlib.sha1(url.rstrip('/').encode()).hexdigest()[:8]
+    name = f"{years.start}-{years.stop - 1}_{months.start}-{months.stop - 1}_{days.start}-{days.stop - 1}_{url_hash}.txt"
+    return os.path.join(base_dir, 'manifests', name)
 
-    for year in years:
-        year_dir = os.path.join(base_dir, str(year))
-        if not os.path.isdir(year_dir):
-            return False
-        if not any(f.endswith('.nc') for f in os.listdir(year_dir)):
-            return False
-    return True
+def read_manifest(years, months, days, url, base_dir="goes16_data"):
+    """Files (year/name.nc) selected for this range, None if they are not all downloaded"""
+    path = manifest_path(years, months, days, url, base_dir)
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        files = [line.strip() for line in f if line.strip()]
+    if not all(os.path.isfile(os.path.join(base_dir, name)) for name in files):
+        return None
+    return files
+
+def check_data_exists(years, months, days, url, base_dir="goes16_data"):
+    """Check if the files for this year/month/day range were all downloaded"""
+    return read_manifest(years, months, days, url, base_dir) is not None
 
 def parse_range(arg):
 
@@ -24,24 +33,24 @@ def parse_range(arg):
         return range(parts[0], parts[0] + 1)
     return range(parts[0], parts[1] + 1)
 
-def main():
+def process_alive(pid):
+    """True if a process with this pid exists"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
 
-    parser = argparse.ArgumentParser(description='Radiation Damage Simulation Pipeline')
-    parser.add_argument('--length', type=float, required=True, help='Copper length in nm')
-    parser.add_argument('--width', type=float, required=True, help='Copper width in nm')
-    parser.add_argument('--thickness', type=float, required=True, help='Copper thickness in nm')
-    parser.add_argument('--years', type=str, default='2020,2025', help='Year range (e.g. 2020 or 2020,2022)')
-    parser.add_argument('--months', type=str, default='1,12', help='Month range (e.g. 1 or 1,3)')
-    parser.add_argument('--days', type=str, default='1,31', help='Day range (e.g. 1 or 1,15)')
-    parser.add_argument('--scale_factor', type=float, default=1.0, help='Scaling factor for proton count example, you have data of 1 day scaling 356 would give 1 year result')
-    parser.add_argument('--url', type=str, required=True, help='Base URL for downloading GOES-16 data')
-    args = parser.parse_args()
+PIPELINE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+def build_config(args):
+    """Build the simulation.config contents from parsed arguments"""
     YEARS = parse_range(args.years)
     MONTHS = parse_range(args.months)
     DAYS = parse_range(args.days)
 
-    #create config file
     config = configparser.ConfigParser()
     config['DIMENSIONS'] = {
         'length_nm': args.length,
@@ -57,54 +66,124 @@ def main():
     config['SCALING'] = {
         'scale_factor': str(args.scale_factor)
     }
+    return config
 
-    with open('simulation.config', 'w') as configfile:
-        config.write(configfile)
+def build_steps(data_exists):
+    """Pipeline steps, with the download step only when data is missing"""
+    steps = [
+        ('create_fluence_data.py', []),
+        ('fluence_to_prob.py', []),
+        ('create_gdml.py', []),
+        ('GRASSHOPPER_SIM', []),
+        ('analyze_output.py', [])
+    ]
+    if not data_exists:
+        steps.insert(0, ('download_db.py', []))
+    return steps
 
-    if check_data_exists(YEARS):
-        print("\nExisting data found. Skipping download.")
-        steps = [
-            ('create_fluence_data.py', []),
-            ('fluence_to_prob.py', []),
-            ('create_gdml.py', []),
-            ('GRASSHOPPER_SIM', []),
-            ('analyze_output.py', [])
-        ]
-    else:
-        print("\nNo existing data found. Starting fresh download.")
-        steps = [
-            ('download_db.py', []),
-            ('create_fluence_data.py', []),
-            ('fluence_to_prob.py', []),
-            ('create_gdml.py', []),
-            ('GRASSHOPPER_SIM', []),
-            ('analyze_output.py', [])
-        ]
-    #Execute scripts in pipeline
+def start_process(cmd, children=None, **kwargs):
+    """Popen that also records the process in children (if given) so it can be stopped"""
+    proc = subprocess.Popen(cmd, **kwargs)
+    if children is not None:
+        children.add(proc)
+    return proc
+
+def wait_process(proc, children=None):
+    returncode = proc.wait()
+    if children is not None:
+        children.discard(proc)
+    return returncode
+
+def run_grasshopper_live(grasshopper_cmd, workdir, env, stdout, children=None):
+    """Run grasshopper with analyze_output.py --follow writing live snapshots next to it"""
+    #Remove the previous run's output so the follower can't pick up its rows
+    for name in ('out_omni.dat', 'out_omni_live.json'):
+        path = os.path.join(workdir, name)
+        if os.path.exists(path):
+            os.remove(path)
+    sim = start_process(grasshopper_cmd, children, cwd=workdir, env=env, stdout=stdout, stderr=stdout)
+    follower = start_process(
+        ['python3', os.path.join(PIPELINE_DIR, 'analyze_output.py'), '--follow', '--pid', str(sim.pid)],
+        children, cwd=workdir, env=env, stdout=stdout, stderr=stdout
+    )
+    returncode = wait_process(sim, children)
+    wait_process(follower, children)
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, grasshopper_cmd)
+
+def run_steps(steps, workdir='.', env=None, stdout=None, step_locks=None, live=False, children=None):
+    """Run pipeline steps inside workdir, return True if all steps succeed
+
+    step_locks maps a step name to a context manager held while that step runs
+    (used by the job service to serialize downloads and limit grasshopper runs).
+    With live=True the grasshopper output is followed while it is written
+    (see analyze_output.py --follow). Running child processes are kept in the
+    children set, if given, so the caller can terminate them.
+    """
+    step_locks = step_locks or {}
     for script, extra_args in steps:
+        lock = step_locks.get(script, contextlib.nullcontext())
         if script == 'GRASSHOPPER_SIM':
-            print("\n=== Running Grasshopper Simulation ===")
-            start_year, end_year = YEARS.start, YEARS.stop - 1
-            actual_years = end_year - start_year + 1
-            scaled_years = int(actual_years * args.scale_factor)
+            print("\n=== Running Grasshopper Simulation ===", file=stdout, flush=True)
             grasshopper_cmd = [
                 'grasshopper',
                 f'copper_omni.gdml',
                 f'out_omni'
             ]
             try:
-                print(grasshopper_cmd)
-                subprocess.run(grasshopper_cmd, check=True)
+                print(grasshopper_cmd, file=stdout, flush=True)
+                with lock:
+                    if live:
+                        run_grasshopper_live(grasshopper_cmd, workdir, env, stdout, children)
+                    else:
+                        sim = start_process(grasshopper_cmd, children, cwd=workdir, env=env,
+                                            stdout=stdout, stderr=stdout)
+                        returncode = wait_process(sim, children)
+                        if returncode != 0:
+                            raise subprocess.CalledProcessError(returncode, grasshopper_cmd)
             except Exception:
-                print("grasshopper not installed or failed to execute")
-                exit(1)
+                print("grasshopper not installed or failed to execute", file=stdout, flush=True)
+                return False
         else:
-            print(f"\n=== Running {script} ===")
-            cmd = ['python3', script] + extra_args
-            result = subprocess.run(cmd, check=False)
-            if result.returncode != 0:
-                print(f"Error running {script}")
-                exit(1)
+            print(f"\n=== Running {script} ===", file=stdout, flush=True)
+            cmd = ['python3', os.path.join(PIPELINE_DIR, script)] + extra_args
+            with lock:
+                proc = start_process(cmd, children, cwd=workdir, env=env, stdout=stdout, stderr=stdout)
+                returncode = wait_process(proc, children)
+            if returncode != 0:
+                print(f"Error running {script}", file=stdout, flush=True)
+                return False
+    return True
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Radiation Damage Simulation Pipeline')
+    parser.add_argument('--length', type=float, required=True, help='Copper length in nm')
+    parser.add_argument('--width', type=float, required=True, help='Copper width in nm')
+    parser.add_argument('--thickness', type=float, required=True, help='Copper thickness in nm')
+    parser.add_argument('--years', type=str, default='2020,2025', help='Year range (e.g. 2020 or 2020,2022)')
+    parser.add_argument('--months', type=str, default='1,12', help='Month range (e.g. 1 or 1,3)')
+    parser.add_argument('--days', type=str, default='1,31', help='Day range (e.g. 1 or 1,15)')
+    parser.add_argument('--scale_factor', type=float, default=1.0, help='Scaling factor for proton count example, you have data of 1 day scaling 356 would give 1 year result')
+    parser.add_argument('--url', type=str, required=True, help='Base URL for downloading GOES-16 data')
+    parser.add_argument('--live', action='store_true', help='Follow grasshopper output while it runs, snapshots go to out_omni_live.json')
+    args = parser.parse_args()
+
+    #create config file
+    config = build_config(args)
+    with open('simulation.config', 'w') as configfile:
+        config.write(configfile)
+
+    data_exists = check_data_exists(parse_range(args.years), parse_range(args.months),
+                                    parse_range(args.days), args.url)
+    if data_exists:
+        print("\nExisting data found. Skipping download.")
+    else:
+        print("\nNo existing data found. Starting fresh download.")
+
+    #Execute scripts in pipeline
+    if not run_steps(build_steps(data_exists), live=args.live):
+        exit(1)
 
 
 if __name__ == "__main__":